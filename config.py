@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+from pathlib import Path
 
 # API Keys - set these as environment variables
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
@@ -20,9 +21,48 @@ GPT_MODEL = "gpt-4o-mini"
 GEMINI_MODEL = "gemini-1.5-flash"
 DEEPSEEK_MODEL = "deepseek-chat"
 
+# Network settings
+HTTP_TIMEOUT_SECONDS = 120.0
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 75.0  # keep idle connections through user checkpoints
+MAX_RETRIES = 4  # retries after the first attempt, with jittered exponential backoff
+MAX_CONCURRENT_REQUESTS = {"anthropic": 5, "openai": 10, "gemini": 10, "deepseek": 10}
+MAX_CONCURRENT_FLOWS = 4  # topics processed at once by run_batch
+USE_RAW_CHAT = False  # GPT/DeepSeek via direct POST on the shared pool instead of the SDK
+
+# Response cache — identical prompts are answered locally (IDEA_UNPACKER_NO_CACHE=1 to bypass)
+CACHE_DIR = Path.home() / ".cache" / "idea_unpacker"
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+MEMORY_CACHE_MAX_ENTRIES = 256  # responses kept in memory per process, least recently used dropped first
+
 # Flow settings
-MAX_REFINEMENT_CYCLES = 3
+MAX_REFINEMENT_CYCLES = 3  # initial budget; adapted to the score trend
+MAX_REFINEMENT_CYCLES_CEILING = 5
+MIN_IMPROVEMENT_RATE = 0.2  # mean gain per cycle below which refinement stops
 PLATEAU_THRESHOLD = 0.5
+PROJECTION_MARGIN = 0.5  # stop when the projected final score falls this far below the bar
+FEEDBACK_REPEAT_THRESHOLD = 0.7  # Jaccard overlap with last cycle's feedback that counts as a plateau
+FEEDBACK_ITEM_MAX_CHARS = 200  # truncate each feedback point sent to refinement
 SCORE_DIVERGENCE_THRESHOLD = 2
+MULTI_SAMPLE_SCORING = False  # score with one n=2 GPT call instead of GPT + DeepSeek
 WORD_LIMIT = 150
-MINIMUM_BAR_FLOOR = 8.0
\ No newline at end of file
+DRAFT_MAX_TOKENS = 2 * WORD_LIMIT + 256  # content incl. JSON escaping, explainer and wrapper
+MINIMUM_BAR_FLOOR = 8.0
+
+# Speculative refinement: draft a bolder variant alongside each refinement
+SPECULATIVE_REFINEMENT = True
+SPECULATIVE_MIN_ACCEPTANCE = 0.3  # disable once the variant rarely wins
+SPECULATIVE_MIN_ATTEMPTS = 4  # outcomes needed before the acceptance rate is trusted
+SPECULATIVE_WINDOW = 20  # most recent outcomes considered, across runs
+SPECULATION_LOG_PATH = CACHE_DIR / "speculation.json"
+
+# Draft evaluation: Gemini scores first, DeepSeek re-scores only near the bar
+DRAFT_EVAL_PREFLIGHT = True
+DRAFT_EVAL_MARGIN = 1.5
+
+# Fused cycles: Claude self-evaluates and rewrites in one call, alternating with DeepSeek
+FUSED_EVAL_REFINE = False
+
+# Claude thread: step6 and step7b refinements extend one conversation to reuse its cached prefix
+USE_CONVERSATION = True
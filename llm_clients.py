@@ -1,33 +1,259 @@
 """
-LLM client wrappers using official SDKs.
+Async LLM client wrappers.
+Claude, GPT and DeepSeek use the official async SDKs; Gemini uses raw httpx.
+All four share one connection pool, retry policy and response cache.
 """
 
+import asyncio
+import functools
+import hashlib
+import inspect
 import json
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
 import httpx
-from openai import OpenAI
-from anthropic import Anthropic
+import orjson
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
 import config
 
 
-# Initialize clients
-anthropic_client = Anthropic(api_key=config.ANTHROPIC_API_KEY)
-openai_client = OpenAI(api_key=config.OPENAI_API_KEY)
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# Shared HTTP pool — every provider reuses the same keep-alive connections
+http_client = httpx.AsyncClient(
+    http2=True,  # multiplex concurrent requests to one host over a single connection
+    timeout=httpx.Timeout(config.HTTP_TIMEOUT_SECONDS),
+    limits=httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_SECONDS
+    )
+)
+
+# Initialize clients once; all of them ride on the shared pool.
+# The SDKs retry 429/5xx/connection errors themselves with jittered backoff.
+anthropic_client = AsyncAnthropic(
+    api_key=config.ANTHROPIC_API_KEY,
+    http_client=http_client,
+    max_retries=config.MAX_RETRIES
+)
+openai_client = AsyncOpenAI(
+    api_key=config.OPENAI_API_KEY,
+    http_client=http_client,
+    max_retries=config.MAX_RETRIES
+)
+deepseek_client = AsyncOpenAI(
+    api_key=config.DEEPSEEK_API_KEY,
+    base_url=DEEPSEEK_BASE_URL,
+    http_client=http_client,
+    max_retries=config.MAX_RETRIES
+)
+
+# Per-provider concurrency caps, sized to account rate limits
+_limits = {
+    provider: asyncio.Semaphore(n)
+    for provider, n in config.MAX_CONCURRENT_REQUESTS.items()
+}
+
+
+# Cache key -> (file, response), least recently used first
+_memory_cache: OrderedDict[str, tuple[Path, object]] = OrderedDict()
+
+
+def disk_cached(namespace: str, model: str):
+    """
+    Cache a call_* coroutine's responses in memory and on disk.
+    Keyed by a 128-bit BLAKE2b of function, model and call arguments;
+    pass cache=False for a call whose reply must be fresh (scores),
+    or set IDEA_UNPACKER_NO_CACHE=1 to bypass everywhere.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        
+        @functools.wraps(fn)
+        async def wrapper(*args, cache: bool = True, **kwargs):
+            if not cache or os.getenv("IDEA_UNPACKER_NO_CACHE") == "1":
+                return await fn(*args, **kwargs)
+            
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key_parts = [fn.__qualname__, model] + [f"{k}={v!r}" for k, v in bound.arguments.items()]
+            key = hashlib.blake2b("\x00".join(key_parts).encode(), digest_size=16).hexdigest()
+            
+            if key in _memory_cache:
+                _memory_cache.move_to_end(key)
+                return _memory_cache[key][1]
+            
+            path = config.CACHE_DIR / namespace / f"{key}.json"
+            try:
+                if time.time() - path.stat().st_mtime < config.CACHE_TTL_SECONDS:
+                    result = orjson.loads(path.read_bytes())
+                    _remember(key, path, result)
+                    return result
+                path.unlink()  # expired
+            except (OSError, orjson.JSONDecodeError):
+                pass
+            
+            result = await fn(*args, **kwargs)
+            _remember(key, path, result)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(orjson.dumps(result))
+            except OSError:
+                pass  # cache is best-effort
+            return result
+        return wrapper
+    return decorator
+
+
+def _remember(key: str, path: Path, result) -> None:
+    """Add a response to the memory layer, dropping the least recently used beyond the cap."""
+    _memory_cache[key] = (path, result)
+    while len(_memory_cache) > config.MEMORY_CACHE_MAX_ENTRIES:
+        _memory_cache.popitem(last=False)
+
+
+def evict_cached_response(text: str) -> None:
+    """Drop every cached entry that returned this text, so the next run asks the model again."""
+    # call_gpt_samples caches a list of texts
+    stale = [
+        key for key, (_, result) in _memory_cache.items()
+        if result == text or (isinstance(result, list) and text in result)
+    ]
+    for key in stale:
+        path, _ = _memory_cache.pop(key)
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+class TruncatedResponseError(ValueError):
+    """The model stopped at its max_tokens limit, so the response is incomplete."""
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Rate limits, server errors and network failures are worth retrying."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+# Retry policy for raw httpx calls (the SDK clients retry on their own)
+_retry_transient = retry(
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(config.MAX_RETRIES + 1),
+    retry=retry_if_exception(_is_transient),
+    reraise=True
+)
+
+
+async def warm_connections():
+    """Open a pooled connection to every provider before the first real call."""
+    urls = [anthropic_client.base_url, openai_client.base_url, GEMINI_BASE_URL, DEEPSEEK_BASE_URL]
+    await asyncio.gather(*[http_client.head(str(url)) for url in urls], return_exceptions=True)
 
 
-async def call_claude(prompt: str, system: str = None) -> str:
-    """Call Anthropic Claude API."""
+async def warm_anthropic():
+    """Keep the pooled Anthropic connection hot ahead of an imminent Claude call."""
+    try:
+        await http_client.head(str(anthropic_client.base_url))
+    except httpx.HTTPError:
+        pass  # warming is best-effort
+
+
+async def close_clients():
+    """Close the shared HTTP pool. Call once on shutdown."""
+    await http_client.aclose()
+
+
+@disk_cached("claude", config.CLAUDE_MODEL)
+async def call_claude(
+    prompt: str, 
+    system: str = None, 
+    stop_after_json: bool = False, 
+    max_tokens: int = 2048
+) -> str:
+    """
+    Call Anthropic Claude API (streamed).
+    With stop_after_json=True, stops reading once a complete JSON value has arrived.
+    """
+    return await _claude_stream(
+        [{"role": "user", "content": prompt}], system, stop_after_json, max_tokens
+    )
+
+
+class ClaudeConversation:
+    """
+    Multi-turn Claude thread. Each send() extends the same message list, so the
+    server-side prompt cache covers everything before the newest user turn.
+    """
+    
+    def __init__(self, system: str = None):
+        self.system = system
+        self.messages: list[dict] = []
+    
+    async def send(self, prompt: str, stop_after_json: bool = False, max_tokens: int = 2048) -> str:
+        """Append a user turn, stream Claude's reply, and keep both in the history."""
+        # Cache breakpoint on the newest turn; the next send() reads up to here from cache
+        turn = {"role": "user", "content": [
+            {"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}
+        ]}
+        reply = await _claude_stream([*self.messages, turn], self.system, stop_after_json, max_tokens)
+        self.messages += [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": reply}
+        ]
+        return reply
+    
+    def fork(self) -> "ClaudeConversation":
+        """Copy of the thread so far; the copy and the original then diverge independently."""
+        twin = ClaudeConversation(self.system)
+        twin.messages = list(self.messages)
+        return twin
+
+
+async def _claude_stream(
+    messages: list[dict], 
+    system: str = None, 
+    stop_after_json: bool = False, 
+    max_tokens: int = 2048
+) -> str:
+    """Stream one Claude completion over the given messages."""
     kwargs = {
         "model": config.CLAUDE_MODEL,
-        "max_tokens": 2048,
-        "messages": [{"role": "user", "content": prompt}]
+        "max_tokens": max_tokens,
+        "messages": messages
     }
     if system:
-        kwargs["system"] = system
+        # Mark the system prompt cacheable so repeated calls reuse the prefix
+        kwargs["system"] = [
+            {"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}
+        ]
     
-    response = anthropic_client.messages.create(**kwargs)
-    return response.content[0].text
+    # Stream so tokens are consumed as they arrive instead of in one final read
+    chunks = []
+    watch = _JsonCloseWatch() if stop_after_json else None
+    async with _limits["anthropic"]:
+        async with anthropic_client.messages.stream(**kwargs) as stream:
+            async for text in stream.text_stream:
+                chunks.append(text)
+                if watch and watch.feed(chunks):
+                    break
+            else:
+                # A cut-off reply must fail here, not be "repaired" into a partial draft
+                if (await stream.get_final_message()).stop_reason == "max_tokens":
+                    raise TruncatedResponseError(f"Claude reply hit max_tokens={max_tokens}")
+    return "".join(chunks)
 
 
+@disk_cached("gpt", config.GPT_MODEL)
 async def call_gpt(prompt: str, system: str = None) -> str:
     """Call OpenAI GPT API."""
     messages = []
@@ -35,57 +261,280 @@ async def call_gpt(prompt: str, system: str = None) -> str:
         messages.append({"role": "system", "content": system})
     messages.append({"role": "user", "content": prompt})
     
-    response = openai_client.chat.completions.create(
-        model=config.GPT_MODEL,
-        messages=messages,
-        max_tokens=2048
-    )
-    return response.choices[0].message.content
+    async with _limits["openai"]:
+        samples = await _openai_chat(openai_client, config.GPT_MODEL, messages)
+    return samples[0]
+
+
+@disk_cached("gpt", config.GPT_MODEL)
+async def call_gpt_samples(prompt: str, n: int = 2, system: str = None) -> list[str]:
+    """Call OpenAI GPT API once for n independent samples of the same prompt."""
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
+    
+    async with _limits["openai"]:
+        return await _openai_chat(openai_client, config.GPT_MODEL, messages, n=n)
 
 
-async def call_gemini(prompt: str) -> str:
-    """Call Google Gemini API (still using httpx - no official sync SDK)."""
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            f"https://generativelanguage.googleapis.com/v1beta/models/{config.GEMINI_MODEL}:generateContent",
+@disk_cached("gemini", config.GEMINI_MODEL)
+@_retry_transient
+async def call_gemini(prompt: str, system: str = None, json_mode: bool = False) -> str:
+    """Call Google Gemini API (raw httpx on the shared pool). json_mode forces JSON output."""
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"maxOutputTokens": 2048}
+    }
+    if json_mode:
+        payload["generationConfig"]["responseMimeType"] = "application/json"
+    if system:
+        payload["systemInstruction"] = {"parts": [{"text": system}]}
+    
+    async with _limits["gemini"]:
+        response = await http_client.post(
+            f"{GEMINI_BASE_URL}/v1beta/models/{config.GEMINI_MODEL}:generateContent",
             headers={"Content-Type": "application/json"},
             params={"key": config.GOOGLE_API_KEY},
-            json={
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {"maxOutputTokens": 2048}
-            }
+            json=payload
         )
-        response.raise_for_status()
-        return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+    response.raise_for_status()
+    candidate = response.json()["candidates"][0]
+    if candidate.get("finishReason") == "MAX_TOKENS":
+        raise TruncatedResponseError("Gemini reply hit maxOutputTokens=2048")
+    return candidate["content"]["parts"][0]["text"]
 
 
-async def call_deepseek(prompt: str, system: str = None) -> str:
-    """Call DeepSeek API (OpenAI-compatible)."""
-    deepseek_client = OpenAI(
-        api_key=config.DEEPSEEK_API_KEY,
-        base_url="https://api.deepseek.com"
-    )
-    
+@disk_cached("deepseek", config.DEEPSEEK_MODEL)
+async def call_deepseek(
+    prompt: str, 
+    system: str = None, 
+    stop_after_json: bool = False, 
+    json_mode: bool = False
+) -> str:
+    """
+    Call DeepSeek API (OpenAI-compatible, streamed).
+    With stop_after_json=True, stops reading once a complete JSON value has arrived.
+    json_mode forces a syntactically valid JSON object.
+    """
     messages = []
     if system:
         messages.append({"role": "system", "content": system})
     messages.append({"role": "user", "content": prompt})
     
-    response = deepseek_client.chat.completions.create(
-        model=config.DEEPSEEK_MODEL,
-        messages=messages,
-        max_tokens=2048
+    async with _limits["deepseek"]:
+        samples = await _openai_chat(
+            deepseek_client, config.DEEPSEEK_MODEL, messages, 
+            stop_after_json=stop_after_json, json_mode=json_mode
+        )
+    return samples[0]
+
+
+async def _openai_chat(
+    client: AsyncOpenAI, 
+    model: str, 
+    messages: list[dict], 
+    n: int = 1,
+    stop_after_json: bool = False,
+    json_mode: bool = False
+) -> list[str]:
+    """Chat completion via the SDK, or a direct POST when USE_RAW_CHAT is set. One text per sample."""
+    kwargs = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": 2048
+    }
+    if json_mode:
+        # Provider-side constraint: output is always one valid JSON object
+        kwargs["response_format"] = {"type": "json_object"}
+    
+    if config.USE_RAW_CHAT:
+        return await _raw_chat(str(client.base_url), client.api_key, {**kwargs, "n": n})
+    
+    if n > 1:
+        response = await client.chat.completions.create(**kwargs, n=n)
+        _check_finish([choice.finish_reason for choice in response.choices], model)
+        return [choice.message.content for choice in response.choices]
+    
+    # Single completions stream, so reading can stop as soon as the payload is usable
+    chunks = []
+    finish_reason = None
+    watch = _JsonCloseWatch() if stop_after_json else None
+    async with await client.chat.completions.create(**kwargs, stream=True) as stream:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            if choice.delta.content:
+                chunks.append(choice.delta.content)
+                if watch and watch.feed(chunks):
+                    break
+        else:
+            _check_finish([finish_reason], model)
+    return ["".join(chunks)]
+
+
+def _check_finish(finish_reasons: list[str | None], model: str) -> None:
+    """Raise if any OpenAI-compatible completion was cut off at max_tokens."""
+    if "length" in finish_reasons:
+        raise TruncatedResponseError(f"{model} reply hit max_tokens")
+
+
+@_retry_transient
+async def _raw_chat(base_url: str, api_key: str, payload: dict) -> list[str]:
+    """POST an OpenAI-compatible chat completion on the shared pool, skipping SDK overhead."""
+    response = await http_client.post(
+        f"{base_url.rstrip('/')}/chat/completions",
+        headers={"Authorization": f"Bearer {api_key}"},
+        json=payload
     )
-    return response.choices[0].message.content
+    response.raise_for_status()
+    choices = response.json()["choices"]
+    _check_finish([choice.get("finish_reason") for choice in choices], payload["model"])
+    return [choice["message"]["content"] for choice in choices]
+
+
+# Optional ```json fence on either side; group 1 is the payload
+_FENCE_RE = re.compile(r"^\s*(?:```(?:json)?)?\s*(.*?)\s*(?:```)?\s*$", re.DOTALL)
+
+
+# Only the characters that change nesting or string state; everything else is skipped in C
+_STRUCTURAL_RE = re.compile(r'[{}\[\]"\\]')
+
+
+def _scan_json(text: str) -> tuple[int | None, int | None, list[str], bool]:
+    """
+    Walk the first top-level JSON object or array in text, skipping string contents.
+    Returns (start, end, open_brackets, in_string); end is None if the value never closes.
+    """
+    stack = []
+    start = None
+    in_string = False
+    escaped_at = -1
+    for m in _STRUCTURAL_RE.finditer(text):
+        ch, i = m.group(), m.start()
+        if in_string:
+            if ch == "\\" and escaped_at != i:
+                escaped_at = i + 1
+            elif ch == '"' and escaped_at != i:
+                in_string = False
+        elif ch == '"':
+            if start is not None:
+                in_string = True
+        elif ch in "{[":
+            if start is None:
+                start = i
+            stack.append(ch)
+        elif start is not None:
+            stack.pop()
+            if not stack:
+                return start, i + 1, stack, False
+    return start, None, stack, in_string
+
+
+def _json_span(text: str) -> tuple[int, int] | None:
+    """Locate the first complete top-level JSON object or array as (start, end), or None."""
+    start, end, _, _ = _scan_json(text)
+    return (start, end) if end is not None else None
+
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _repair_json(text: str) -> str:
+    """
+    Fix syntax slips in an otherwise complete JSON value (trailing commas).
+    Unclosed values are left alone: closing them would pass truncated data off as whole.
+    """
+    span = _json_span(text)
+    if span is None:
+        return text
+    return _TRAILING_COMMA_RE.sub(r"\1", text[span[0]:span[1]])
+
+
+class _JsonCloseWatch:
+    """
+    Incremental _scan_json over a streamed reply. feed() scans only the newest chunk,
+    carrying bracket and string state across chunks, and reports True once the reply
+    opens with a JSON value (optionally fenced) that has closed and parses.
+    Braces in leading prose never stop the stream.
+    """
+    
+    _LEADERS = ("", "```", "```json")
+    
+    def __init__(self):
+        self.stack: list[str] = []
+        self.start = None
+        self.in_string = False
+        self.escaped_at = -1
+        self.offset = 0
+        self.done = False  # leading value seen and rejected; read the reply to the end
+    
+    def feed(self, chunks: list[str]) -> bool:
+        chunk = chunks[-1]
+        offset, self.offset = self.offset, self.offset + len(chunk)
+        if self.done:
+            return False
+        for m in _STRUCTURAL_RE.finditer(chunk):
+            ch, i = m.group(), offset + m.start()
+            if self.in_string:
+                if ch == "\\" and self.escaped_at != i:
+                    self.escaped_at = i + 1
+                elif ch == '"' and self.escaped_at != i:
+                    self.in_string = False
+            elif ch == '"':
+                if self.start is not None:
+                    self.in_string = True
+            elif ch in "{[":
+                if self.start is None:
+                    self.start = i
+                    if "".join(chunks)[:i].strip() not in self._LEADERS:
+                        self.done = True  # prose first: no safe point to stop early
+                        return False
+                self.stack.append(ch)
+            elif self.start is not None:
+                self.stack.pop()
+                if not self.stack:
+                    self.done = True
+                    return _parses("".join(chunks)[self.start:i + 1])
+        return False
+
+
+def _parses(payload: str) -> bool:
+    try:
+        orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        try:
+            json.loads(payload)  # NaN/Infinity
+        except json.JSONDecodeError:
+            return False
+    return True
+
+
+def extract_json_payload(text: str) -> str:
+    """Strip markdown code fences and surrounding prose from an LLM response, leaving raw JSON text."""
+    payload = _FENCE_RE.match(text).group(1)
+    if payload[:1] in ("{", "[") and payload[-1:] in ("}", "]"):
+        return payload  # fast path: already bare JSON
+    span = _json_span(payload)
+    return payload[span[0]:span[1]] if span else payload
 
 
 def parse_json_response(text: str) -> dict:
-    """Extract JSON from LLM response, handling markdown code blocks."""
-    text = text.strip()
-    if text.startswith("```json"):
-        text = text[7:]
-    elif text.startswith("```"):
-        text = text[3:]
-    if text.endswith("```"):
-        text = text[:-3]
-    return json.loads(text.strip())
+    """Extract JSON from LLM response, handling markdown code blocks and repairable syntax slips."""
+    payload = extract_json_payload(text)
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        pass
+    try:
+        return json.loads(payload)  # tolerates NaN/Infinity, which orjson rejects
+    except json.JSONDecodeError as exc:
+        # Repair locally rather than paying for another LLM round trip
+        try:
+            return json.loads(_repair_json(payload))
+        except json.JSONDecodeError:
+            # Don't let the cache replay the same unusable reply on every re-run
+            evict_cached_response(text)
+            raise exc from None
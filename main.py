@@ -5,6 +5,7 @@ A multi-model agentic flow for unpacking topics into compressed, insightful outp
 
 Usage:
     python main.py
+    python main.py topics.json    # batch: JSON list of {"topic": ..., "intent": ...}
 
 Requires API keys set as environment variables:
     ANTHROPIC_API_KEY, OPENAI_API_KEY, GOOGLE_API_KEY, DEEPSEEK_API_KEY
@@ -13,6 +14,11 @@ Requires API keys set as environment variables:
 
 
 import asyncio
+import json
+import re
+import sys
+import threading
+import time
 from datetime import datetime
 from schemas import UserInput, FlowResult
 from steps import (
@@ -22,9 +28,13 @@ from steps import (
     step5_format_and_criteria,
     step6_articulate,
     step7_evaluate,
+    step7_evaluate_batch,
+    step7_evaluate_draft,
+    step7_fused_eval_refine,
     step7b_refine,
     step8_failure_analysis
 )
+from llm_clients import ClaudeConversation, close_clients, warm_anthropic, warm_connections
 import config
 
 
@@ -39,14 +49,83 @@ def log_provenance(provenance: list, step: str, model: str, detail: str):
     })
 
 
-def get_user_input() -> UserInput:
-    """Step 1: Capture user input via CLI."""
+_speculation_log: list[list] | None = None
+
+
+def speculation_log() -> list[list]:
+    """
+    Recent speculative-variant outcomes across runs, as [timestamp, accepted] pairs.
+    Loaded once per process; outcomes older than the cache TTL are dropped, so a
+    disabled variant gets re-probed once its poor record ages out.
+    """
+    global _speculation_log
+    if _speculation_log is None:
+        try:
+            _speculation_log = json.loads(config.SPECULATION_LOG_PATH.read_text())
+        except (OSError, ValueError):
+            _speculation_log = []
+    cutoff = time.time() - config.CACHE_TTL_SECONDS
+    _speculation_log[:] = [e for e in _speculation_log if e[0] >= cutoff][-config.SPECULATIVE_WINDOW:]
+    return _speculation_log
+
+
+def record_speculation(accepted: bool) -> bool:
+    """Persist one outcome; returns whether speculation is still worth running."""
+    log = speculation_log()
+    log.append([time.time(), accepted])
+    try:
+        config.SPECULATION_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        config.SPECULATION_LOG_PATH.write_text(json.dumps(log))
+    except OSError:
+        pass  # stats are best-effort, like the response cache
+    return speculation_enabled()
+
+
+def speculation_enabled() -> bool:
+    """True until enough outcomes show the variant rarely beats the primary."""
+    log = speculation_log()
+    if len(log) < config.SPECULATIVE_MIN_ATTEMPTS:
+        return True
+    return sum(accepted for _, accepted in log) / len(log) >= config.SPECULATIVE_MIN_ACCEPTANCE
+
+
+def feedback_terms(feedback: list[str]) -> set[str]:
+    """Bag of content words in an evaluation's feedback, for repetition checks."""
+    return {w for f in feedback for w in re.findall(r"[a-z']+", f.lower()) if len(w) > 3}
+
+
+async def ainput(prompt: str) -> str:
+    """
+    input() without blocking the event loop. The reader is a daemon thread, so
+    Ctrl-C at a prompt can exit without waiting for the blocked read to return.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def settle(method, value):
+        if not future.done():
+            method(value)
+    
+    def read():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(settle, future.set_result, line)
+    
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+
+async def get_user_input() -> UserInput:
+    """Step 1: Capture user input via CLI without blocking the event loop."""
     print("\n" + "="*50)
     print("IDEA UNPACKER")
     print("="*50)
     
-    topic = input("\nEnter topic (3-5 words): ").strip()
-    intent = input("Enter your intent/lived experience (1 sentence): ").strip()
+    topic = (await ainput("\nEnter topic (3-5 words): ")).strip()
+    intent = (await ainput("Enter your intent/lived experience (1 sentence): ")).strip()
     
     return UserInput(topic=topic, intent=intent)
 
@@ -54,7 +133,7 @@ def get_user_input() -> UserInput:
 def display_ideas(scored_ideas, selected_index: int):
     """Display scored ideas for user review."""
     print("\n" + "-"*50)
-    print("SCORED IDEAS (GPT + DeepSeek)")
+    print("SCORED IDEAS (GPT x2)" if config.MULTI_SAMPLE_SCORING else "SCORED IDEAS (GPT + DeepSeek)")
     print("-"*50)
     
     for i, si in enumerate(scored_ideas):
@@ -66,12 +145,14 @@ def display_ideas(scored_ideas, selected_index: int):
         print()
 
 
-def user_checkpoint(scored_ideas, top_index: int) -> int:
+async def user_checkpoint(scored_ideas, top_index: int) -> int:
     """Step 4: User confirms or changes selection."""
     display_ideas(scored_ideas, top_index)
     
     print(f"Selected: #{top_index + 1}")
-    choice = input("Press Enter to confirm, or enter different number (1-{}): ".format(len(scored_ideas))).strip()
+    choice = (await ainput(
+        "Press Enter to confirm, or enter different number (1-{}): ".format(len(scored_ideas))
+    )).strip()
     
     if choice and choice.isdigit():
         new_index = int(choice) - 1
@@ -80,15 +161,20 @@ def user_checkpoint(scored_ideas, top_index: int) -> int:
     return top_index
 
 
-async def run_flow() -> FlowResult:
-    """Main orchestration loop."""
+async def run_flow(user_input: UserInput = None) -> FlowResult:
+    """
+    Main orchestration loop.
+    With a user_input given, runs unattended: no prompts, the top-scored idea is kept.
+    """
     provenance = []
     drafts = []
     evaluations = []
     score_history = []
+    interactive = user_input is None
     
     # Step 1: User Input
-    user_input = get_user_input()
+    if interactive:
+        user_input = await get_user_input()
     log_provenance(provenance, "input", "user", f"topic={user_input.topic}")
     
     # Step 2: Generate Ideas
@@ -97,20 +183,44 @@ async def run_flow() -> FlowResult:
     log_provenance(provenance, "ideation", "claude", f"generated {len(ideas)} ideas")
     
     # Step 3: Dual Scoring
-    print("⏳ Scoring ideas (GPT + DeepSeek in parallel)...")
+    if config.MULTI_SAMPLE_SCORING:
+        scorers, scoring_label = "gpt", "GPT, two samples in one call"
+    else:
+        scorers, scoring_label = "gpt+deepseek", "GPT + DeepSeek in parallel"
+    print(f"⏳ Scoring ideas ({scoring_label})...")
     scored_ideas = await step3_dual_scoring(ideas)
     top_idea = step3b_select_top_idea(scored_ideas)
     top_index = scored_ideas.index(top_idea)
-    log_provenance(provenance, "scoring", "gpt+deepseek", f"top={top_idea.idea.name}")
+    log_provenance(provenance, "scoring", scorers, f"top={top_idea.idea.name}")
+    
+    # Speculatively design formats for the two likeliest picks while the user decides
+    ranked = sorted(range(len(scored_ideas)), key=lambda i: scored_ideas[i].combined_score, reverse=True)
+    candidates = list(dict.fromkeys([top_index, *ranked]))[:2 if interactive else 1]
+    format_tasks = {
+        i: asyncio.create_task(step5_format_and_criteria(scored_ideas[i], user_input))
+        for i in candidates
+    }
     
     # Step 4: User Checkpoint
-    final_index = user_checkpoint(scored_ideas, top_index)
+    try:
+        final_index = await user_checkpoint(scored_ideas, top_index) if interactive else top_index
+        format_task = format_tasks.pop(final_index, None)
+    finally:
+        # Cancel the unused prefetches (all of them on abort) and reap them, so a failed
+        # one isn't reported as "Task exception was never retrieved"
+        for task in format_tasks.values():
+            task.cancel()
+        await asyncio.gather(*format_tasks.values(), return_exceptions=True)
     selected = scored_ideas[final_index]
-    log_provenance(provenance, "selection", "user", f"confirmed={selected.idea.name}")
+    log_provenance(provenance, "selection", "user" if interactive else "auto", 
+                   f"confirmed={selected.idea.name}")
     
     # Step 5: Format & Criteria
     print("\n⏳ Designing format and criteria (DeepSeek)...")
-    format_spec = await step5_format_and_criteria(selected, user_input)
+    if format_task:
+        format_spec = await format_task
+    else:
+        format_spec = await step5_format_and_criteria(selected, user_input)
     log_provenance(provenance, "format", "deepseek", 
                    f"type={format_spec.format_type.value}, bar={format_spec.minimum_bar}")
     
@@ -120,25 +230,80 @@ async def run_flow() -> FlowResult:
     
     # Step 6: Initial Articulation
     print("\n⏳ Creating initial draft (Claude)...")
-    draft = await step6_articulate(selected, format_spec)
+    # Refinements continue this thread while its last reply is the current draft
+    conversation = ClaudeConversation() if config.USE_CONVERSATION else None
+    draft = await step6_articulate(selected, format_spec, conversation)
     drafts.append(draft)
     log_provenance(provenance, "draft_v1", "claude", f"words={draft.word_count}")
     
     # Step 7: Refinement Loop
-    for cycle in range(config.MAX_REFINEMENT_CYCLES):
-        print(f"\n⏳ Evaluation cycle {cycle + 1}/{config.MAX_REFINEMENT_CYCLES} (DeepSeek)...")
+    speculative = config.SPECULATIVE_REFINEMENT and speculation_enabled()
+    spec_attempts = 0
+    spec_accepted = 0
+    candidate = None
+    candidate_conversation = None
+    feedback_history: list[set[str]] = []
+    budget = config.MAX_REFINEMENT_CYCLES
+    cycle = 0
+    claude_warmup = None
+    while cycle < budget:
+        print(f"\n⏳ Evaluation cycle {cycle + 1}/{budget}...")
+        evaluator = "deepseek"
+        fused_draft = None
+        # Fused cycles alternate with DeepSeek cycles to keep a cross-model check
+        use_fused = config.FUSED_EVAL_REFINE and cycle % 2 == 0 and cycle < budget - 1
+        claude_warmup = None
+        if not use_fused and cycle < budget - 1:
+            # Refinement (Claude) follows evaluation; have its connection ready
+            claude_warmup = asyncio.create_task(warm_anthropic())
         
-        evaluation = await step7_evaluate(draft, format_spec, score_history)
+        if candidate:
+            # Judge the speculative variant alongside the primary in one request
+            evaluation, candidate_eval = await step7_evaluate_batch(
+                [draft, candidate], format_spec, score_history
+            )
+            spec_attempts += 1
+            accepted = candidate_eval.total_score > evaluation.total_score
+            if accepted:
+                spec_accepted += 1
+                draft, evaluation = candidate, candidate_eval
+                drafts[-1] = draft
+                conversation = candidate_conversation
+            speculative = record_speculation(accepted)
+            log_provenance(provenance, "speculation", "claude",
+                           f"accepted={spec_accepted}/{spec_attempts}")
+            candidate = None
+        elif use_fused:
+            evaluation, fused_draft = await step7_fused_eval_refine(
+                draft, format_spec, selected, score_history
+            )
+            evaluator = "claude"
+        elif config.DRAFT_EVAL_PREFLIGHT:
+            # Cheap Gemini pass first; DeepSeek only verifies scores near the bar
+            evaluation = await step7_evaluate_draft(draft, format_spec, score_history)
+            draft_accepted = abs(evaluation.total_score - format_spec.minimum_bar) > config.DRAFT_EVAL_MARGIN
+            log_provenance(provenance, f"preflight_v{draft.version}", "gemini",
+                           f"score={evaluation.total_score}, draft_accepted={draft_accepted}")
+            if draft_accepted:
+                evaluator = "gemini"
+            else:
+                evaluation = await step7_evaluate(draft, format_spec, score_history)
+        else:
+            evaluation = await step7_evaluate(draft, format_spec, score_history)
         evaluations.append(evaluation)
         score_history.append(evaluation.total_score)
-        log_provenance(provenance, f"eval_v{draft.version}", "deepseek", 
-                       f"score={evaluation.total_score}")
+        # Block efficiency: refinements that raised the score / refinements tried
+        improved = sum(b > a for a, b in zip(score_history, score_history[1:]))
+        log_provenance(provenance, f"eval_v{draft.version}", evaluator, 
+                       f"score={evaluation.total_score}, BE={improved}/{len(score_history) - 1}")
         
         print(f"   Score: {evaluation.total_score:.1f} / {format_spec.minimum_bar}")
         
         # Check success
         if evaluation.total_score >= format_spec.minimum_bar:
             print("✅ Bar met!")
+            if claude_warmup:
+                claude_warmup.cancel()
             return FlowResult(
                 success=True,
                 final_draft=draft,
@@ -149,17 +314,61 @@ async def run_flow() -> FlowResult:
         
         # Check plateau
         if evaluation.plateau_detected:
-            print("⚠️  Plateau detected — stopping early")
+            print(f"⚠️  Plateau detected (projected {evaluation.projected_final_score:.1f}) — stopping early")
             break
         
+        # Adapt the cycle budget to the observed improvement rate
+        if len(score_history) >= 2:
+            slope = (score_history[-1] - score_history[0]) / (len(score_history) - 1)
+            if slope <= config.MIN_IMPROVEMENT_RATE:
+                print("⚠️  Scores not improving — stopping early")
+                break
+            # Improving runs never get fewer cycles than the fixed starting budget
+            new_budget = max(
+                cycle + 1, config.MAX_REFINEMENT_CYCLES,
+                min(config.MAX_REFINEMENT_CYCLES_CEILING, 2 + int(2 * slope))
+            )
+            if new_budget != budget:
+                print(f"   Cycle budget: {budget} → {new_budget} (mean gain {slope:.2f}/cycle)")
+                budget = new_budget
+        
+        # Stop if the evaluator keeps asking for the same changes
+        terms = feedback_terms(evaluation.feedback)
+        if feedback_history and terms:
+            prev = feedback_history[-1]
+            if len(terms & prev) / len(terms | prev) > config.FEEDBACK_REPEAT_THRESHOLD:
+                evaluation.plateau_detected = True
+                print("⚠️  Feedback repeating — stopping early")
+                break
+        feedback_history.append(terms)
+        
         # Refine if not last cycle
-        if cycle < config.MAX_REFINEMENT_CYCLES - 1:
+        if cycle < budget - 1:
             print(f"   Feedback: {evaluation.feedback[0][:60]}...")
-            print(f"⏳ Refining (Claude)...")
-            draft = await step7b_refine(draft, evaluation, format_spec, selected)
+            if claude_warmup:
+                await claude_warmup  # usually long done; otherwise refinement needs that handshake anyway
+            if fused_draft:
+                draft = fused_draft
+                conversation = None  # the thread no longer ends with the current draft
+            elif speculative:
+                print("⏳ Refining (Claude, primary + speculative variant)...")
+                candidate_conversation = conversation.fork() if conversation else None
+                draft, candidate = await asyncio.gather(
+                    step7b_refine(draft, evaluation, format_spec, selected, conversation=conversation),
+                    step7b_refine(draft, evaluation, format_spec, selected, speculative=True,
+                                  conversation=candidate_conversation)
+                )
+            else:
+                print(f"⏳ Refining (Claude)...")
+                draft = await step7b_refine(draft, evaluation, format_spec, selected,
+                                            conversation=conversation)
             drafts.append(draft)
             log_provenance(provenance, f"draft_v{draft.version}", "claude", 
                            f"words={draft.word_count}")
+        cycle += 1
+    
+    if claude_warmup:
+        claude_warmup.cancel()  # loop ended early; no refinement follows
     
     # Step 8: Failure Path
     print("\n❌ Bar not met. Analyzing failure...")
@@ -176,6 +385,20 @@ async def run_flow() -> FlowResult:
     )
 
 
+async def run_batch(user_inputs: list[UserInput]) -> list[FlowResult | Exception]:
+    """
+    Run unattended flows concurrently over the shared connection pool.
+    A failed topic yields its exception in place, so the other results survive.
+    """
+    sem = asyncio.Semaphore(config.MAX_CONCURRENT_FLOWS)
+    
+    async def one(user_input: UserInput) -> FlowResult:
+        async with sem:
+            return await run_flow(user_input)
+    
+    return await asyncio.gather(*(one(u) for u in user_inputs), return_exceptions=True)
+
+
 def display_result(result: FlowResult):
     """Display final output."""
     print("\n" + "="*50)
@@ -202,14 +425,37 @@ def display_result(result: FlowResult):
 
 async def main():
     """Entry point."""
+    # Eager tasks start running synchronously up to their first await (3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    
+    # DNS + TLS handshakes overlap with the user typing the topic
+    warmup = asyncio.create_task(warm_connections())
+    
     try:
-        result = await run_flow()
-        display_result(result)
-    except KeyboardInterrupt:
+        if len(sys.argv) > 1:
+            with open(sys.argv[1]) as f:
+                user_inputs = [UserInput(**item) for item in json.load(f)]
+            results = await run_batch(user_inputs)
+            for user_input, result in zip(user_inputs, results):
+                if isinstance(result, Exception):
+                    print(f"\n❌ Topic '{user_input.topic}' failed: {type(result).__name__}: {result}")
+                else:
+                    display_result(result)
+            failed = sum(isinstance(r, Exception) for r in results)
+            print(f"\n📦 Batch: {len(results) - failed}/{len(results)} topics completed")
+        else:
+            result = await run_flow()
+            display_result(result)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # Under asyncio.run, Ctrl-C arrives as cancellation of this task
         print("\n\nAborted by user.")
     except Exception as e:
         print(f"\n❌ Error: {e}")
         raise
+    finally:
+        warmup.cancel()
+        await close_clients()
 
 
 if __name__ == "__main__":
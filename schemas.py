@@ -2,6 +2,7 @@
 Data schemas for the Idea Unpacker flow.
 """
 
+from functools import cached_property
 from pydantic import BaseModel, Field
 from typing import Optional
 from enum import Enum
@@ -43,6 +44,11 @@ class FormatSpec(BaseModel):
     rationale: str
     criteria: list[str] = Field(..., min_length=3, max_length=5)
     minimum_bar: float = Field(..., ge=1, le=10)
+    
+    @cached_property
+    def criteria_text(self) -> str:
+        """Bulleted criteria, rendered once for evaluation prompts."""
+        return "\n".join([f"- {c}" for c in self.criteria])
 
 
 class Draft(BaseModel):
@@ -50,6 +56,7 @@ class Draft(BaseModel):
     explainer: str
     word_count: int
     version: int
+    prior_feedback_hashes: list[str] = []  # normalized feedback already sent to refinement
 
 
 class Evaluation(BaseModel):
@@ -57,6 +64,7 @@ class Evaluation(BaseModel):
     total_score: float
     feedback: list[str] = Field(..., max_length=3)
     plateau_detected: bool = False
+    projected_final_score: float = 0  # linear extrapolation to the last allowed cycle
 
 
 class FlowResult(BaseModel):
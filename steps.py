@@ -3,29 +3,29 @@ Step functions for the Idea Unpacker flow.
 """
 
 import asyncio
+import hashlib
+import re
+import statistics
+from pydantic import TypeAdapter, ValidationError
 from schemas import (
     UserInput, Idea, ScoredIdea, FormatSpec, Draft, 
     Evaluation, OutputFormat
 )
 from llm_clients import (
-    call_claude, call_gpt, call_gemini, call_deepseek, 
-    parse_json_response
+    ClaudeConversation,
+    call_claude, call_gpt, call_gpt_samples, call_gemini, call_deepseek, 
+    extract_json_payload, parse_json_response
 )
 import config
 
 
-# Step 1: User Input (handled in main.py via CLI)
+# Validates JSON text straight into models, skipping the intermediate dicts
+_IDEA_LIST = TypeAdapter(list[Idea])
 
 
-async def step2_generate_ideas(user_input: UserInput) -> list[Idea]:
-    """
-    Step 2: Grounded Idea Generation via Claude.
-    Returns 4-5 ideas, at least 3 from named authors.
-    """
-    prompt = f"""Given this topic and intent, generate 4-5 underexplored angles.
+# Static system prompts — identical across calls so provider prompt caching can reuse them
 
-Topic: {user_input.topic}
-Intent: {user_input.intent}
+_SYSTEM_STEP2 = """Given a topic and intent, generate 4-5 underexplored angles.
 
 Requirements:
 - At least 3 ideas must reference specific authors/thinkers who have written about related concepts
@@ -35,19 +35,165 @@ Requirements:
 - Reject famous frameworks that require reinterpretation to fit
 
 Return JSON array:
-[{{
+[{
     "name": "short angle name",
     "description": "one sentence",
     "why_underexplored": "one sentence", 
     "source": "Author Name" or "model-generated",
     "is_model_generated": true/false
-}}]
+}]
 
 Return ONLY valid JSON, no other text."""
 
-    response = await call_claude(prompt)
-    ideas_data = parse_json_response(response)
-    return [Idea(**idea) for idea in ideas_data]
+_SYSTEM_STEP3 = """Score each idea for ORIGINALITY (1-10).
+High scores = genuinely novel, underexplored, non-obvious.
+Low scores = well-trodden, obvious, mainstream.
+
+Return JSON array:
+[{"idea_index": 0, "score": 7.5, "rationale": "one sentence"}]
+
+Return ONLY valid JSON."""
+
+_SYSTEM_STEP5 = """Given an idea and user intent, design the output format.
+
+Requirements:
+- Choose format that EMBODIES the idea (becomes it, not describes it)
+- Formats: poem, quotes, micro_essay, aphorisms, dialogue
+- If dialogue, speakers must be concrete people, not abstractions or personified concepts
+- Define exactly 3 evaluation criteria:
+  1. "surprise_density" — insight per sentence, penalize filler and obvious statements
+  2. "embodiment" — does the form itself demonstrate the idea, not just explain it?
+  3. One criterion specific to this idea's core tension
+- Set minimum_bar between 8.0-9.5 (high bar — most first drafts should fail)
+
+Reject outputs that:
+- State the obvious
+- Use clichés or common advice language
+- Could appear in a typical self-help book
+- Tell rather than show
+
+Return JSON:
+{
+    "format_type": "micro_essay",
+    "rationale": "why this format embodies (not describes) the idea",
+    "criteria": ["surprise_density", "embodiment", "idea_specific_criterion"],
+    "minimum_bar": 8.5
+}"""
+
+_SYSTEM_STEP6 = f"""You write short pieces that embody an idea rather than describe it.
+
+HARD CONSTRAINT: Maximum {config.WORD_LIMIT} words for the main content.
+
+Return JSON:
+{{
+    "content": "the piece itself, in the requested format",
+    "explainer": "2 sentences max explaining the core insight"
+}}
+
+Return ONLY valid JSON."""
+
+_SYSTEM_STEP7 = """Evaluate the draft against the given criteria, scoring each 1-10.
+
+Requirements:
+- Be harsh but fair
+- Feedback must be specific and actionable
+- Maximum 3 feedback points
+
+Return JSON:
+{
+    "scores": {"criterion_name": 7.5},
+    "total_score": 7.0,
+    "feedback": ["specific improvement 1", "specific improvement 2"]
+}"""
+
+_SYSTEM_STEP7_BATCH = """Evaluate each draft independently against the given criteria, scoring each 1-10.
+
+Requirements:
+- Score each draft on its own merits, do not rank them against each other
+- Be harsh but fair
+- Feedback must be specific and actionable
+- Maximum 3 feedback points per draft
+
+Return JSON array, one entry per draft:
+[{
+    "draft_index": 0,
+    "scores": {"criterion_name": 7.5},
+    "total_score": 7.0,
+    "feedback": ["specific improvement 1", "specific improvement 2"]
+}]
+
+Return ONLY valid JSON."""
+
+_SYSTEM_STEP7B = f"""You improve drafts based on evaluator feedback.
+
+HARD CONSTRAINT: Maximum {config.WORD_LIMIT} words.
+
+Return JSON:
+{{
+    "content": "the improved piece, in the same format",
+    "explainer": "2 sentences max"
+}}
+
+Return ONLY valid JSON."""
+
+_SYSTEM_STEP7_FUSED = f"""You evaluate a draft against criteria, then rewrite it to address your own evaluation.
+
+Evaluation requirements:
+- Score as a harsh outside reviewer, not as the author
+- Feedback must be specific and actionable
+- Maximum 3 feedback points
+
+Rewrite requirements:
+- Address every feedback point
+- HARD CONSTRAINT: Maximum {config.WORD_LIMIT} words for the main content
+
+Return JSON:
+{{
+    "evaluation": {{
+        "scores": {{"criterion_name": 7.5}},
+        "total_score": 7.0,
+        "feedback": ["specific improvement 1", "specific improvement 2"]
+    }},
+    "new_draft": {{
+        "content": "the rewritten piece, in the same format",
+        "explainer": "2 sentences max"
+    }}
+}}
+
+Return ONLY valid JSON."""
+
+_SYSTEM_STEP8 = """Analyze why this flow failed to meet the quality bar.
+
+Diagnose in 3 sentences max:
+- Was the initial idea weak?
+- Was the format wrong?
+- Was execution the problem?
+- Was the bar unrealistic for this topic?
+
+Return plain text, no JSON."""
+
+_APPROACH_PATCH = "Address the feedback directly while keeping what already works."
+_APPROACH_REWORK = "Rework the structure or central image rather than patching lines — keep the idea."
+
+
+# Step 1: User Input (handled in main.py via CLI)
+
+
+async def step2_generate_ideas(user_input: UserInput) -> list[Idea]:
+    """
+    Step 2: Grounded Idea Generation via Claude.
+    Returns 4-5 ideas, at least 3 from named authors.
+    """
+    prompt = f"""Topic: {user_input.topic}
+Intent: {user_input.intent}"""
+
+    response = await call_claude(prompt, system=_SYSTEM_STEP2)
+    payload = extract_json_payload(response)
+    try:
+        return _IDEA_LIST.validate_json(payload)
+    except ValidationError:
+        # Malformed JSON gets the repairing parser before giving up
+        return _IDEA_LIST.validate_python(parse_json_response(payload))
 
 
 async def step3_dual_scoring(ideas: list[Idea]) -> list[ScoredIdea]:
@@ -60,23 +206,19 @@ async def step3_dual_scoring(ideas: list[Idea]) -> list[ScoredIdea]:
         for i, idea in enumerate(ideas)
     ])
     
-    scoring_prompt = f"""Score each idea for ORIGINALITY (1-10).
-High scores = genuinely novel, underexplored, non-obvious.
-Low scores = well-trodden, obvious, mainstream.
-
-Ideas:
-{ideas_text}
-
-Return JSON array:
-[{{"idea_index": 0, "score": 7.5, "rationale": "one sentence"}}]
+    scoring_prompt = f"""Ideas:
+{ideas_text}"""
 
-Return ONLY valid JSON."""
-
-    # Parallel calls
-    score_1_task = call_gpt(scoring_prompt)
-    score_2_task = call_deepseek(scoring_prompt)
-    
-    response_1, response_2 = await asyncio.gather(score_1_task, score_2_task)
+    if config.MULTI_SAMPLE_SCORING:
+        # One GPT request, two independent samples — saves a round trip, loses model diversity
+        response_1, response_2 = await call_gpt_samples(scoring_prompt, n=2, system=_SYSTEM_STEP3)
+    else:
+        # Parallel calls — both requests are dispatched before either is awaited
+        async with asyncio.TaskGroup() as tg:
+            score_1_task = tg.create_task(call_gpt(scoring_prompt, system=_SYSTEM_STEP3))
+            score_2_task = tg.create_task(call_deepseek(scoring_prompt, system=_SYSTEM_STEP3))
+        
+        response_1, response_2 = score_1_task.result(), score_2_task.result()
     
     scores_1 = {s["idea_index"]: s for s in parse_json_response(response_1)}
     scores_2 = {s["idea_index"]: s for s in parse_json_response(response_2)}
@@ -104,13 +246,13 @@ Return ONLY valid JSON."""
 def step3b_select_top_idea(scored_ideas: list[ScoredIdea]) -> ScoredIdea:
     """Prefer high-divergence ideas (contested = interesting), then highest score."""
     
-    divergent = [s for s in scored_ideas if s.score_delta > config.SCORE_DIVERGENCE_THRESHOLD]
-    
-    if divergent:
-        top = max(divergent, key=lambda x: x.combined_score)
+    # One pass: divergent ideas rank above all others, ties broken by score
+    top = max(
+        scored_ideas,
+        key=lambda x: (x.score_delta > config.SCORE_DIVERGENCE_THRESHOLD, x.combined_score)
+    )
+    if top.score_delta > config.SCORE_DIVERGENCE_THRESHOLD:
         print(f"⚡ Prioritizing divergent idea (contested = interesting)")
-    else:
-        top = max(scored_ideas, key=lambda x: x.combined_score)
     
     return top
 
@@ -122,40 +264,12 @@ async def step5_format_and_criteria(
     """
     Step 5: DeepSeek proposes format, criteria, and minimum bar.
     """
-    prompt = f"""Given this idea and user intent, design the output format.
-
-Idea: {selected.idea.name}
+    prompt = f"""Idea: {selected.idea.name}
 Description: {selected.idea.description}
 User topic: {user_input.topic}
-User intent: {user_input.intent}
-
-Requirements:
-- Choose format that EMBODIES the idea (becomes it, not describes it)
-- Formats: poem, quotes, micro_essay, aphorisms, dialogue
-- If dialogue, speakers must be concrete people, not abstractions or personified concepts
-- Define exactly 3 evaluation criteria:
-  1. "surprise_density" — insight per sentence, penalize filler and obvious statements
-  2. "embodiment" — does the form itself demonstrate the idea, not just explain it?
-  3. One criterion specific to this idea's core tension
-- Set minimum_bar between 8.0-9.5 (high bar — most first drafts should fail)
-
-Reject outputs that:
-- State the obvious
-- Use clichés or common advice language
-- Could appear in a typical self-help book
-- Tell rather than show
-
-Return JSON:
-{{
-    "format_type": "micro_essay",
-    "rationale": "why this format embodies (not describes) the idea",
-    "criteria": ["surprise_density", "embodiment", "idea_specific_criterion"],
-    "minimum_bar": 8.5
-}}
-
-Return ONLY valid JSON."""
+User intent: {user_input.intent}"""
 
-    response = await call_deepseek(prompt)
+    response = await call_deepseek(prompt, system=_SYSTEM_STEP5, stop_after_json=True, json_mode=True)
     data = parse_json_response(response)
     data["minimum_bar"] = max(data.get("minimum_bar", 8.0), config.MINIMUM_BAR_FLOOR)
     return FormatSpec(**data)
@@ -163,10 +277,12 @@ Return ONLY valid JSON."""
 
 async def step6_articulate(
     selected: ScoredIdea, 
-    format_spec: FormatSpec
+    format_spec: FormatSpec,
+    conversation: ClaudeConversation = None
 ) -> Draft:
     """
     Step 6: Claude creates first draft within word limit.
+    With a conversation, opens the thread that step7b_refine continues.
     """
     prompt = f"""Create a {format_spec.format_type.value} that embodies this idea.
 
@@ -174,27 +290,22 @@ Idea: {selected.idea.name}
 Description: {selected.idea.description}
 Why underexplored: {selected.idea.why_underexplored}
 
-HARD CONSTRAINT: Maximum {config.WORD_LIMIT} words for the main content.
-
 Format requirements:
-{format_spec.rationale}
-
-Return JSON:
-{{
-    "content": "your {format_spec.format_type.value} here",
-    "explainer": "2 sentences max explaining the core insight"
-}}
+{format_spec.rationale}"""
 
-Return ONLY valid JSON."""
-
-    response = await call_claude(prompt)
+    if conversation is not None:
+        conversation.system = _SYSTEM_STEP6
+        response = await conversation.send(prompt, stop_after_json=True, max_tokens=config.DRAFT_MAX_TOKENS)
+    else:
+        response = await call_claude(
+            prompt, system=_SYSTEM_STEP6, stop_after_json=True, max_tokens=config.DRAFT_MAX_TOKENS
+        )
     data = parse_json_response(response)
-    word_count = len(data["content"].split())
     
     return Draft(
         content=data["content"],
         explainer=data["explainer"],
-        word_count=word_count,
+        word_count=_count_words(data["content"]),
         version=1
     )
 
@@ -208,64 +319,173 @@ async def step7_evaluate(
     Step 7: DeepSeek evaluates against criteria.
     Detects plateau if improvement stalls.
     """
-    criteria_text = "\n".join([f"- {c}" for c in format_spec.criteria])
-    
-    prompt = f"""Evaluate this draft against the criteria.
+    prompt = _evaluation_prompt(draft, format_spec)
 
-Draft:
+    # Scores are never cached: a replayed score would repeat the same refinement decisions
+    response = await call_deepseek(
+        prompt, system=_SYSTEM_STEP7, stop_after_json=True, json_mode=True, cache=False
+    )
+    data = parse_json_response(response)
+    return _build_evaluation(data, previous_scores, format_spec.minimum_bar)
+
+
+async def step7_evaluate_draft(
+    draft: Draft, 
+    format_spec: FormatSpec,
+    previous_scores: list[float] = None
+) -> Evaluation:
+    """
+    Step 7 (preflight): Gemini scores with the same prompt as step7_evaluate.
+    Cheap first pass; only contested scores near the bar go on to DeepSeek.
+    """
+    prompt = _evaluation_prompt(draft, format_spec)
+    response = await call_gemini(prompt, system=_SYSTEM_STEP7, json_mode=True, cache=False)
+    data = parse_json_response(response)
+    return _build_evaluation(data, previous_scores, format_spec.minimum_bar)
+
+
+async def step7_evaluate_batch(
+    drafts: list[Draft],
+    format_spec: FormatSpec,
+    previous_scores: list[float] = None
+) -> list[Evaluation]:
+    """
+    Step 7 (batched): DeepSeek evaluates several candidate drafts in one request.
+    Used when a speculative variant competes with the primary refinement.
+    """
+    drafts_text = "\n\n".join([
+        f"Draft {i}:\n{d.content}\n\nExplainer {i}:\n{d.explainer}"
+        for i, d in enumerate(drafts)
+    ])
+    
+    prompt = f"""{drafts_text}
+
+Criteria:
+{format_spec.criteria_text}"""
+
+    response = await call_deepseek(prompt, system=_SYSTEM_STEP7_BATCH, stop_after_json=True, cache=False)
+    entries = parse_json_response(response)
+    results = {r.get("draft_index"): r for r in entries}
+    if set(results) != set(range(len(drafts))):
+        # Indices missing or numbered differently (e.g. from 1): trust list order instead
+        results = dict(enumerate(entries))
+    missing = [i for i in range(len(drafts)) if i not in results]
+    if missing:
+        raise ValueError(
+            f"Batch evaluation returned {len(entries)} entries for {len(drafts)} drafts "
+            f"(missing draft {', '.join(map(str, missing))})"
+        )
+    return [_build_evaluation(results[i], previous_scores, format_spec.minimum_bar) for i in range(len(drafts))]
+
+
+def _evaluation_prompt(draft: Draft, format_spec: FormatSpec) -> str:
+    """Build the single-draft evaluation user prompt shared by DeepSeek and Gemini."""
+    return f"""Draft:
 {draft.content}
 
 Explainer:
 {draft.explainer}
 
-Criteria (score each 1-10):
-{criteria_text}
+Criteria:
+{format_spec.criteria_text}"""
 
-Requirements:
-- Be harsh but fair
-- Feedback must be specific and actionable
-- Maximum 3 feedback points
 
-Return JSON:
-{{
-    "scores": {{"criterion_name": 7.5}},
-    "total_score": 7.0,
-    "feedback": ["specific improvement 1", "specific improvement 2"]
-}}
+def _count_words(text: str) -> int:
+    """Whitespace-delimited word count, as enforced by WORD_LIMIT."""
+    # str.split runs entirely in C; regex/NumPy scans measured slower at draft sizes
+    return len(text.split())
 
-Return ONLY valid JSON."""
 
-    response = await call_deepseek(prompt)
-    data = parse_json_response(response)
+def _feedback_hash(item: str) -> str:
+    """Hash of a feedback item with case, punctuation and spacing normalized away."""
+    normalized = " ".join(re.findall(r"[a-z0-9']+", item.lower()))
+    return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+
+def _build_evaluation(
+    data: dict, 
+    previous_scores: list[float] = None, 
+    minimum_bar: float = None
+) -> Evaluation:
+    """
+    Build an Evaluation from parsed JSON, detecting plateau against history.
+    Also flags a plateau when the score trend cannot reach the bar in the remaining cycles.
+    """
+    plateau = bool(previous_scores) and len(previous_scores) >= 2 and _is_plateau(
+        data["total_score"], previous_scores[-1], previous_scores[-2], config.PLATEAU_THRESHOLD
+    )
     
-    # Detect plateau
-    plateau = False
-    if previous_scores and len(previous_scores) >= 2:
-        recent_improvement = data["total_score"] - previous_scores[-1]
-        prior_improvement = previous_scores[-1] - previous_scores[-2] if len(previous_scores) > 1 else 1
-        if recent_improvement < config.PLATEAU_THRESHOLD and prior_improvement < config.PLATEAU_THRESHOLD:
-            plateau = True
+    scores = [*(previous_scores or []), data["total_score"]]
+    projected = _project_score(scores)
+    # A trend needs two points; a single low first score is what refinement is for
+    if minimum_bar is not None and len(scores) >= 2 and projected < minimum_bar - config.PROJECTION_MARGIN:
+        plateau = True
     
     return Evaluation(
         scores=data["scores"],
         total_score=data["total_score"],
         feedback=data["feedback"][:3],
-        plateau_detected=plateau
+        plateau_detected=plateau,
+        projected_final_score=projected
     )
 
 
+def _project_score(scores: list[float]) -> float:
+    """
+    Extrapolate the linear score trend to the last cycle the adaptive budget allows.
+    With a single score there is no trend, so that score is returned unchanged.
+    """
+    if len(scores) < 2:
+        return scores[-1]
+    slope = statistics.linear_regression(range(len(scores)), scores).slope
+    remaining = max(0, config.MAX_REFINEMENT_CYCLES_CEILING - len(scores))
+    return scores[-1] + slope * remaining
+
+
+def _is_plateau(current: float, prev: float, prev2: float, threshold: float) -> bool:
+    """True when the last two improvements both fell below the threshold."""
+    return (current - prev) < threshold and (prev - prev2) < threshold
+
+
 async def step7b_refine(
     draft: Draft, 
     evaluation: Evaluation, 
     format_spec: FormatSpec,
-    selected: ScoredIdea
+    selected: ScoredIdea,
+    speculative: bool = False,
+    conversation: ClaudeConversation = None
 ) -> Draft:
     """
     Step 7 (refinement): Claude incorporates feedback.
+    With speculative=True, asks for a bolder rework instead of a patch.
+    With a conversation whose last reply is this draft, sends only the feedback turn.
     """
-    feedback_text = "\n".join([f"- {f}" for f in evaluation.feedback])
+    # Cap each item's length; inside a conversation, feedback sent in earlier turns is
+    # already in the thread, but a fresh prompt has no history and needs all of it
+    hashes = [_feedback_hash(f) for f in evaluation.feedback]
+    fresh = evaluation.feedback
+    if conversation is not None:
+        fresh = [
+            f for f, h in zip(evaluation.feedback, hashes)
+            if h not in draft.prior_feedback_hashes
+        ] or evaluation.feedback
+    feedback_text = "\n".join([f"- {f[:config.FEEDBACK_ITEM_MAX_CHARS]}" for f in fresh])
+    approach = _APPROACH_REWORK if speculative else _APPROACH_PATCH
     
-    prompt = f"""Improve this draft based on feedback.
+    if conversation is not None:
+        # Idea and current draft are already in the thread
+        prompt = f"""Improve your {format_spec.format_type.value} based on feedback.
+
+Feedback to address:
+{feedback_text}
+
+Current score: {evaluation.total_score}
+Target: {format_spec.minimum_bar}
+
+Approach: {approach}"""
+        response = await conversation.send(prompt, stop_after_json=True, max_tokens=config.DRAFT_MAX_TOKENS)
+    else:
+        prompt = f"""Improve this {format_spec.format_type.value} based on feedback.
 
 Current draft:
 {draft.content}
@@ -276,27 +496,60 @@ Feedback to address:
 Current score: {evaluation.total_score}
 Target: {format_spec.minimum_bar}
 
-HARD CONSTRAINT: Maximum {config.WORD_LIMIT} words.
+Approach: {approach}
 
 Original idea for reference:
-{selected.idea.name}: {selected.idea.description}
-
-Return JSON:
-{{
-    "content": "improved {format_spec.format_type.value}",
-    "explainer": "2 sentences max"
-}}
-
-Return ONLY valid JSON."""
-
-    response = await call_claude(prompt)
+{selected.idea.name}: {selected.idea.description}"""
+        response = await call_claude(
+            prompt, system=_SYSTEM_STEP7B, stop_after_json=True, max_tokens=config.DRAFT_MAX_TOKENS
+        )
     data = parse_json_response(response)
     
     return Draft(
         content=data["content"],
         explainer=data["explainer"],
-        word_count=len(data["content"].split()),
-        version=draft.version + 1
+        word_count=_count_words(data["content"]),
+        version=draft.version + 1,
+        prior_feedback_hashes=list(dict.fromkeys(draft.prior_feedback_hashes + hashes))
+    )
+
+
+async def step7_fused_eval_refine(
+    draft: Draft, 
+    format_spec: FormatSpec,
+    selected: ScoredIdea,
+    previous_scores: list[float] = None
+) -> tuple[Evaluation, Draft]:
+    """
+    Step 7 (fused): Claude self-evaluates the draft and rewrites it in one call.
+    Returns the evaluation of the current draft and the next draft.
+    """
+    prompt = f"""Evaluate and then improve this {format_spec.format_type.value}.
+
+Draft:
+{draft.content}
+
+Explainer:
+{draft.explainer}
+
+Criteria (score each 1-10):
+{format_spec.criteria_text}
+
+Target: {format_spec.minimum_bar}
+
+Original idea for reference:
+{selected.idea.name}: {selected.idea.description}"""
+
+    response = await call_claude(prompt, system=_SYSTEM_STEP7_FUSED, stop_after_json=True)
+    data = parse_json_response(response)
+    new_draft = data["new_draft"]
+    
+    return _build_evaluation(data["evaluation"], previous_scores, format_spec.minimum_bar), Draft(
+        content=new_draft["content"],
+        explainer=new_draft["explainer"],
+        word_count=_count_words(new_draft["content"]),
+        version=draft.version + 1,
+        prior_feedback_hashes=draft.prior_feedback_hashes
     )
 
 
@@ -314,9 +567,7 @@ async def step8_failure_analysis(
         for d, e in zip(drafts, evaluations)
     ])
     
-    prompt = f"""Analyze why this flow failed to meet the quality bar.
-
-Idea: {selected.idea.name}
+    prompt = f"""Idea: {selected.idea.name}
 Format: {format_spec.format_type.value}
 Minimum bar: {format_spec.minimum_bar}
 
@@ -324,14 +575,6 @@ Score history:
 {history}
 
 Final draft:
-{drafts[-1].content}
-
-Diagnose in 3 sentences max:
-- Was the initial idea weak?
-- Was the format wrong?
-- Was execution the problem?
-- Was the bar unrealistic for this topic?
-
-Return plain text, no JSON."""
+{drafts[-1].content}"""
 
-    return await call_deepseek(prompt)
+    return await call_deepseek(prompt, system=_SYSTEM_STEP8)
@@ -0,0 +1,163 @@
+"""Tests for llm_clients helpers, with the provider SDKs faked out."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_clients
+
+
+class _FakeStream:
+    def __init__(self, chunks: list[str], stop_reason: str):
+        self._chunks = chunks
+        self._stop_reason = stop_reason
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+    
+    @property
+    async def text_stream(self):
+        for chunk in self._chunks:
+            yield chunk
+    
+    async def get_final_message(self):
+        return SimpleNamespace(stop_reason=self._stop_reason)
+
+
+def _fake_claude(monkeypatch, chunks: list[str], stop_reason: str):
+    monkeypatch.setattr(
+        llm_clients.anthropic_client.messages, "stream",
+        lambda **kwargs: _FakeStream(chunks, stop_reason)
+    )
+
+
+def test_claude_stream_raises_on_max_tokens(monkeypatch):
+    _fake_claude(monkeypatch, ['{"content": "a poem that ne'], "max_tokens")
+    
+    with pytest.raises(llm_clients.TruncatedResponseError):
+        asyncio.run(llm_clients._claude_stream([{"role": "user", "content": "hi"}], max_tokens=10))
+
+
+def test_claude_stream_returns_complete_reply(monkeypatch):
+    _fake_claude(monkeypatch, ['{"content": "x", ', '"explainer": "y"}'], "end_turn")
+    
+    text = asyncio.run(llm_clients._claude_stream([{"role": "user", "content": "hi"}]))
+    
+    assert text == '{"content": "x", "explainer": "y"}'
+
+
+def test_unparseable_cached_response_is_evicted(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_clients.config, "CACHE_DIR", tmp_path)
+    monkeypatch.delenv("IDEA_UNPACKER_NO_CACHE", raising=False)
+    
+    @llm_clients.disk_cached("test", "model")
+    async def fake_call(prompt: str) -> str:
+        return "Sorry, I cannot score these ideas."
+    
+    response = asyncio.run(fake_call("hi"))
+    assert list(tmp_path.glob("test/*.json"))
+    
+    with pytest.raises(ValueError):
+        llm_clients.parse_json_response(response)
+    
+    assert not list(tmp_path.glob("test/*.json"))
+    assert all(result != response for _, result in llm_clients._memory_cache.values())
+
+
+def test_eviction_drops_every_entry_with_the_same_text(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_clients.config, "CACHE_DIR", tmp_path)
+    monkeypatch.delenv("IDEA_UNPACKER_NO_CACHE", raising=False)
+    
+    @llm_clients.disk_cached("test", "model")
+    async def fake_call(prompt: str) -> str:
+        return "Sorry, I cannot help with that."
+    
+    response = asyncio.run(fake_call("first"))
+    asyncio.run(fake_call("second"))
+    assert len(list(tmp_path.glob("test/*.json"))) == 2
+    
+    llm_clients.evict_cached_response(response)
+    
+    assert not list(tmp_path.glob("test/*.json"))
+
+
+def test_memory_cache_drops_least_recently_used(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_clients.config, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(llm_clients.config, "MEMORY_CACHE_MAX_ENTRIES", 2)
+    monkeypatch.setattr(llm_clients, "_memory_cache", llm_clients.OrderedDict())
+    monkeypatch.delenv("IDEA_UNPACKER_NO_CACHE", raising=False)
+    
+    @llm_clients.disk_cached("test", "model")
+    async def fake_call(prompt: str) -> str:
+        return prompt.upper()
+    
+    for prompt in ["a", "b", "a", "c"]:
+        asyncio.run(fake_call(prompt))
+    
+    assert [result for _, result in llm_clients._memory_cache.values()] == ["A", "C"]
+
+
+def test_uncached_call_always_reaches_the_model(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_clients.config, "CACHE_DIR", tmp_path)
+    monkeypatch.delenv("IDEA_UNPACKER_NO_CACHE", raising=False)
+    calls = []
+    
+    @llm_clients.disk_cached("test", "model")
+    async def fake_call(prompt: str) -> str:
+        calls.append(prompt)
+        return '{"overall_score": 7}'
+    
+    asyncio.run(fake_call("score", cache=False))
+    asyncio.run(fake_call("score", cache=False))
+    
+    assert calls == ["score", "score"]
+    assert not list(tmp_path.glob("test/*.json"))
+
+
+def _stops_after(chunks: list[str]) -> int | None:
+    """Index of the chunk at which the stream would stop early, or None."""
+    watch = llm_clients._JsonCloseWatch()
+    for i in range(len(chunks)):
+        if watch.feed(chunks[:i + 1]):
+            return i
+    return None
+
+
+def test_json_watch_stops_when_leading_value_closes():
+    assert _stops_after(['{"content": "a ', 'b}"', ', "x": [1]}', " trailing prose"]) == 2
+
+
+def test_json_watch_allows_fence_and_split_escapes():
+    # {"q": "say \"hi\""}, split right after each backslash
+    assert _stops_after(['```json\n{"q": "say \\', '"hi\\', '""}', "\n```"]) == 2
+
+
+def test_json_watch_ignores_braces_in_preamble_prose():
+    chunks = ["I'll fill in {the idea} below:\n", '{"content": "x", "explainer": "y"}']
+    
+    assert _stops_after(chunks) is None
+
+
+def test_repair_fixes_trailing_comma_but_not_truncation():
+    assert llm_clients.parse_json_response('{"feedback": ["a", "b",],}') == {"feedback": ["a", "b"]}
+    
+    with pytest.raises(ValueError):
+        llm_clients.parse_json_response('{"scores": {"embodiment": 7}, "total_score": 6.5, "feedb')
+
+
+def test_openai_length_cut_raises():
+    response = SimpleNamespace(choices=[
+        SimpleNamespace(finish_reason="stop", message=SimpleNamespace(content="[]")),
+        SimpleNamespace(finish_reason="length", message=SimpleNamespace(content="[{")),
+    ])
+    
+    async def create(**kwargs):
+        return response
+    
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    with pytest.raises(llm_clients.TruncatedResponseError):
+        asyncio.run(llm_clients._openai_chat(client, "gpt", [], n=2))
@@ -0,0 +1,102 @@
+"""Tests for the pure helpers in steps.py (no API calls)."""
+
+import asyncio
+import json
+
+import pytest
+
+import config
+import steps
+from schemas import Draft, Evaluation, FormatSpec, Idea, OutputFormat, ScoredIdea
+from steps import _build_evaluation, _project_score
+
+
+def _data(total: float) -> dict:
+    return {"scores": {"embodiment": total}, "total_score": total, "feedback": ["tighten the ending"]}
+
+
+def test_first_cycle_low_score_does_not_stop_refinement():
+    evaluation = _build_evaluation(_data(7.0), [], minimum_bar=8.5)
+    
+    assert not evaluation.plateau_detected
+    assert evaluation.projected_final_score == 7.0
+
+
+def test_flat_trend_far_below_bar_stops_refinement():
+    evaluation = _build_evaluation(_data(6.1), [6.0], minimum_bar=8.5)
+    
+    assert evaluation.plateau_detected
+
+
+def test_steep_trend_keeps_refining():
+    evaluation = _build_evaluation(_data(7.5), [6.5], minimum_bar=8.5)
+    
+    assert not evaluation.plateau_detected
+    assert evaluation.projected_final_score > 8.5 - config.PROJECTION_MARGIN
+
+
+def test_project_score_extrapolates_to_ceiling():
+    remaining = config.MAX_REFINEMENT_CYCLES_CEILING - 2
+    
+    assert _project_score([6.0, 6.5]) == 6.5 + 0.5 * remaining
+
+
+def _batch(monkeypatch, entries: list[dict]) -> list:
+    async def fake_deepseek(prompt, **kwargs):
+        return json.dumps(entries)
+    
+    monkeypatch.setattr(steps, "call_deepseek", fake_deepseek)
+    spec = FormatSpec(
+        format_type=OutputFormat.POEM, rationale="r", minimum_bar=8.5,
+        criteria=["surprise_density", "embodiment", "resonance"]
+    )
+    drafts = [Draft(content="a", explainer="b", word_count=1, version=v) for v in (2, 2)]
+    return asyncio.run(steps.step7_evaluate_batch(drafts, spec, [6.0]))
+
+
+def _entry(index, total: float) -> dict:
+    return {"draft_index": index, "scores": {}, "total_score": total, "feedback": []}
+
+
+def test_batch_evaluation_matches_by_draft_index(monkeypatch):
+    evaluations = _batch(monkeypatch, [_entry(1, 8.0), _entry(0, 7.0)])
+    
+    assert [e.total_score for e in evaluations] == [7.0, 8.0]
+
+
+def test_batch_evaluation_falls_back_to_list_order(monkeypatch):
+    evaluations = _batch(monkeypatch, [_entry(1, 7.0), _entry(2, 8.0)])
+    
+    assert [e.total_score for e in evaluations] == [7.0, 8.0]
+
+
+def test_batch_evaluation_missing_entry_is_a_clear_error(monkeypatch):
+    with pytest.raises(ValueError, match="missing draft 1"):
+        _batch(monkeypatch, [_entry(0, 7.0)])
+
+
+def test_refine_without_conversation_resends_repeated_feedback(monkeypatch):
+    prompts = []
+    
+    async def fake_claude(prompt, **kwargs):
+        prompts.append(prompt)
+        return '{"content": "new", "explainer": "e"}'
+    
+    monkeypatch.setattr(steps, "call_claude", fake_claude)
+    spec = FormatSpec(
+        format_type=OutputFormat.POEM, rationale="r", minimum_bar=8.5,
+        criteria=["surprise_density", "embodiment", "resonance"]
+    )
+    selected = ScoredIdea(
+        idea=Idea(name="n", description="d", why_underexplored="w", source="s"),
+        score_1=7, score_2=7, rationale_1="r", rationale_2="r"
+    )
+    evaluation = Evaluation(scores={}, total_score=7.0, feedback=["Cut the ending", "Name the city"])
+    draft = Draft(
+        content="old", explainer="e", word_count=1, version=2,
+        prior_feedback_hashes=[steps._feedback_hash("Cut the ending")]
+    )
+    
+    asyncio.run(steps.step7b_refine(draft, evaluation, spec, selected))
+    
+    assert "Cut the ending" in prompts[0] and "Name the city" in prompts[0]